@@ -3,13 +3,14 @@
 import os
 import sys
 import subprocess
-import argparse
+import threading
 from pathlib import Path
-import urllib.request
-import zipfile
 import platform
-import shutil
 import re
+import json
+import time
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 VENV_DIR = Path(__file__).parent / "venv"
 MODELS_DIR = Path(__file__).parent / "models"
@@ -64,63 +65,136 @@ QUALITY_PRESETS = {
     }
 }
 
+_IMG_EXTS = frozenset({".png", ".jpg", ".jpeg", ".webp"})
+
+def _list_images(path):
+    with os.scandir(path) as it:
+        return sorted(Path(e.path) for e in it
+                      if e.is_file() and os.path.splitext(e.name)[1].lower() in _IMG_EXTS)
+
+def _scan_chapters(root):
+    # One pass over the top level picks up chapter dirs and loose images
+    # together; chapters come back sorted for deterministic page ordering.
+    chapters = {}
+    loose_images = []
+
+    with os.scandir(root) as it:
+        for e in it:
+            if e.is_dir(follow_symlinks=False):
+                chapters[Path(e.path)] = None
+            elif e.is_file() and os.path.splitext(e.name)[1].lower() in _IMG_EXTS:
+                loose_images.append(Path(e.path))
+
+    chapters = {subdir: _list_images(subdir) for subdir in sorted(chapters)}
+    return sorted(loose_images), chapters
+
 class ModelError(Exception):
     pass
 
 class EnvironmentError(Exception):
     pass
 
+DOWNLOAD_CHUNK = 1024 * 1024
+
 class DownloadProgressBar:
     def __init__(self):
-        self.pbar = None
+        self.total_size = None
+        self.last_drawn = 0
+        self.last_time = 0.0
 
-    def __call__(self, block_num, block_size, total_size):
-        if not self.pbar:
-            self.pbar = True
+    def update(self, downloaded, total_size):
+        if self.total_size is None:
+            self.total_size = total_size
             print(f"   Total size: {total_size / (1024*1024):.1f} MB")
-        
-        downloaded = block_num * block_size
-        if total_size > 0:
-            percent = min(downloaded * 100 / total_size, 100)
-            bar_length = 50
-            filled_length = int(bar_length * downloaded // total_size)
-            bar = '█' * filled_length + '░' * (bar_length - filled_length)
-            print(f'\r   [{bar}] {percent:.1f}%', end='', flush=True)
-            
-            if downloaded >= total_size:
-                print()
+
+        if total_size <= 0:
+            return
+
+        if downloaded < total_size and \
+           downloaded - self.last_drawn < total_size / 200 and \
+           time.monotonic() - self.last_time < 0.1:
+            return
+
+        self.last_drawn = downloaded
+        self.last_time = time.monotonic()
+
+        percent = min(downloaded * 100 / total_size, 100)
+        filled_length = int(50 * downloaded // total_size)
+        bar = '█' * filled_length + '░' * (50 - filled_length)
+        sys.stdout.write(f'\r   [{bar}] {percent:.1f}%')
+        sys.stdout.flush()
+
+        if downloaded >= total_size:
+            sys.stdout.write('\n')
+
+def download_file(url, dest_path):
+    import urllib.request
+
+    progress = DownloadProgressBar()
+
+    with urllib.request.urlopen(url) as response, open(dest_path, "wb") as f:
+        total_size = int(response.headers.get("Content-Length", 0))
+        downloaded = 0
+
+        while True:
+            chunk = response.read(DOWNLOAD_CHUNK)
+            if not chunk:
+                break
+            f.write(chunk)
+            downloaded += len(chunk)
+            progress.update(downloaded, total_size)
 
 class ProgressTracker:
+    _BAR_FULL = '█' * 50
+
     def __init__(self, total_items, description="Processing"):
         self.total_items = total_items
         self.current_item = 0
         self.description = description
         self.bar_length = 50
+        self._last_filled = -1
+        self._last_time = 0.0
+        self._lock = threading.Lock()
         self._display(None)
-        
+
     def update(self, item_name=None):
-        self.current_item += 1
-        self._display(item_name)
-    
+        with self._lock:
+            self.current_item += 1
+            self._display(item_name)
+
     def _display(self, item_name=None):
         if self.total_items == 0:
             return
-            
-        percent = (self.current_item / self.total_items) * 100
+
         filled_length = int(self.bar_length * self.current_item // self.total_items)
-        bar = '█' * filled_length + '░' * (self.bar_length - filled_length)
-        
+
+        # Repaint only when the bar visibly advances or 100 ms passed;
+        # per-item redraws dominate CPU on long runs otherwise.
+        if filled_length == self._last_filled and \
+           self.current_item < self.total_items and \
+           time.monotonic() - self._last_time < 0.1:
+            return
+
+        bar_changed = filled_length != self._last_filled
+        self._last_filled = filled_length
+        self._last_time = time.monotonic()
+
+        percent = (self.current_item / self.total_items) * 100
+        bar = self._BAR_FULL[:filled_length] + '░' * (self.bar_length - filled_length)
+
         status = f"[{self.current_item}/{self.total_items}]"
         if item_name:
             if len(item_name) > 40:
                 item_name = item_name[:37] + "..."
             status += f" {item_name}"
-        
-        print(f'\r   [{bar}] {percent:.1f}% {status}', end='', flush=True)
-        
+
+        sys.stdout.write(f'\r   [{bar}] {percent:.1f}% {status}')
+        if bar_changed or self.current_item >= self.total_items:
+            sys.stdout.flush()
+
         if self.current_item >= self.total_items:
-            print()
-    
+            sys.stdout.write('\n')
+
     def finish(self):
         if self.current_item < self.total_items:
             self.current_item = self.total_items
@@ -133,84 +207,121 @@ def get_venv_python():
     else:
         return VENV_DIR / "bin" / "python"
 
-def detect_vulkan_gpus():
+# One probe per process: devices do not change mid-run, but a disk
+# cache would go stale the moment they change between runs and a stale
+# id fed to -g fails the whole chapter, so nothing is persisted.
+_GPU_CACHE = None
+
+# Bytes pattern so megabytes of vulkaninfo output are scanned without a decode.
+_DEVICE_NAME_RE = re.compile(rb'deviceName\s*=\s*([^\r\n]+)')
+
+def _quick_vulkan_present():
     system = platform.system()
-    gpus = []
-    
+
     try:
+        if system == "Linux":
+            import ctypes
+            import glob
+
+            icd_files = glob.glob("/usr/share/vulkan/icd.d/*.json") + \
+                        glob.glob("/etc/vulkan/icd.d/*.json")
+            if os.environ.get("VK_ICD_FILENAMES"):
+                icd_files += os.environ["VK_ICD_FILENAMES"].split(os.pathsep)
+
+            for icd_file in icd_files:
+                try:
+                    with open(icd_file) as f:
+                        library = json.load(f).get("ICD", {}).get("library_path")
+                    if not library:
+                        continue
+                    ctypes.CDLL(library, mode=os.RTLD_LAZY)
+                    return True
+                except (OSError, ValueError):
+                    continue
+
+            return False
+
         if system == "Windows":
-            result = subprocess.run(
-                ["vulkaninfo"],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode == 0:
-                lines = result.stdout.split('\n')
-                gpu_id = 0
-                for line in lines:
-                    if 'deviceName' in line:
-                        match = re.search(r'deviceName\s*=\s*(.+)', line)
-                        if match:
-                            gpu_name = match.group(1).strip()
-                            gpus.append({'id': gpu_id, 'name': gpu_name})
-                            gpu_id += 1
-        
-        elif system == "Linux":
-            result = subprocess.run(
-                ["vulkaninfo", "--summary"],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode == 0:
-                lines = result.stdout.split('\n')
-                gpu_id = 0
-                for line in lines:
-                    if 'deviceName' in line:
-                        match = re.search(r'deviceName\s*=\s*(.+)', line)
-                        if match:
-                            gpu_name = match.group(1).strip()
-                            gpus.append({'id': gpu_id, 'name': gpu_name})
-                            gpu_id += 1
-        
-        elif system == "Darwin":
-            result = subprocess.run(
-                ["vulkaninfo", "--summary"],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode == 0:
-                lines = result.stdout.split('\n')
-                gpu_id = 0
-                for line in lines:
-                    if 'deviceName' in line:
-                        match = re.search(r'deviceName\s*=\s*(.+)', line)
-                        if match:
-                            gpu_name = match.group(1).strip()
-                            gpus.append({'id': gpu_id, 'name': gpu_name})
-                            gpu_id += 1
-    
+            import winreg
+            try:
+                with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE,
+                                    r"SOFTWARE\Khronos\Vulkan\Drivers") as key:
+                    return winreg.QueryInfoKey(key)[1] > 0
+            except OSError:
+                return False
+
+    except Exception:
+        pass
+
+    # No cheap check for this platform; let vulkaninfo decide.
+    return True
+
+def detect_vulkan_gpus(refresh=False):
+    global _GPU_CACHE
+
+    if os.environ.get("MANGA_UPSCALER_NO_GPU_PROBE"):
+        return []
+
+    if not refresh and _GPU_CACHE is not None:
+        return _GPU_CACHE
+
+    # Library presence != usable device: skip the expensive vulkaninfo
+    # fork when no ICD even loads (opt-in while we gain confidence).
+    if os.environ.get("MANGA_UPSCALER_QUICK_VK") and not _quick_vulkan_present():
+        _GPU_CACHE = []
+        return []
+
+    # Probe in a short-lived spawned child so any driver context or VRAM
+    # pinned by device enumeration is released before the upscale run.
+    try:
+        import multiprocessing
+
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(1) as pool:
+            gpus = pool.apply(_detect_vulkan_gpus_impl)
+    except Exception:
+        gpus = _detect_vulkan_gpus_impl()
+
+    _GPU_CACHE = gpus
+    return gpus
+
+def _detect_vulkan_gpus_impl():
+    system = platform.system()
+    gpus = []
+
+    if system == "Windows":
+        cmd = ["vulkaninfo"]
+    else:
+        cmd = ["vulkaninfo", "--summary"]
+
+    try:
+        result = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            timeout=10
+        )
+
+        if result.returncode == 0:
+            gpus = [{'id': gpu_id, 'name': match.group(1).decode(errors="replace").strip()}
+                    for gpu_id, match in enumerate(_DEVICE_NAME_RE.finditer(result.stdout))]
+
     except FileNotFoundError:
         pass
     except subprocess.TimeoutExpired:
         pass
     except Exception:
         pass
-    
+
     return gpus
 
 def list_gpus():
     print("\n" + "="*67)
     print("DETECTED VULKAN GPUS")
     print("="*67 + "\n")
-    
-    gpus = detect_vulkan_gpus()
-    
+
+    gpus = detect_vulkan_gpus(refresh=True)
+
     if not gpus:
         print("No Vulkan GPUs detected or vulkaninfo not available.\n")
         print("Make sure you have:")
@@ -234,21 +345,23 @@ def list_gpus():
     print(f"\nTo use a specific GPU, add: --gpu {gpus[0]['id']}")
     print(f"Example: python manga_upscaler.py -i ./input --gpu 1\n")
 
+@functools.lru_cache(maxsize=1)
 def check_waifu2x_installed():
     system = platform.system()
     exe_name = "waifu2x-ncnn-vulkan.exe" if system == "Windows" else "waifu2x-ncnn-vulkan"
     waifu_bin = BIN_DIR / exe_name
     models_dir = MODELS_DIR / "waifu2x" / "models-cunet"
-    
+
     if not waifu_bin.exists():
         return False, f"Binary not found: {waifu_bin}"
-    
+
     if not models_dir.exists():
         return False, f"Models directory not found: {models_dir}"
-    
-    if not any(models_dir.iterdir()):
-        return False, f"Models directory is empty: {models_dir}"
-    
+
+    with os.scandir(models_dir) as it:
+        if next(it, None) is None:
+            return False, f"Models directory is empty: {models_dir}"
+
     return True, "OK"
 
 def verify_model_requirements(model_name):
@@ -268,9 +381,29 @@ def verify_model_requirements(model_name):
         error_text = "\n".join(errors)
         raise ModelError(f"\nModel requirements not met:\n\n{error_text}\n")
 
+def _extract_member(zip_ref, member, target):
+    import shutil
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + ".part")
+
+    with zip_ref.open(member) as src, open(tmp, "wb", buffering=ZIP_CHUNK) as dst:
+        shutil.copyfileobj(src, dst, ZIP_CHUNK)
+
+    # Windows AV scanners briefly lock freshly written files; retry the
+    # rename instead of sleeping unconditionally.
+    for attempt in range(5):
+        try:
+            os.replace(tmp, target)
+            return
+        except PermissionError:
+            time.sleep(0.1 * (attempt + 1))
+
+    os.replace(tmp, target)
+
 def download_waifu2x():
-    import time
-    
+    import zipfile
+
     BIN_DIR.mkdir(exist_ok=True)
     
     system = platform.system()
@@ -299,7 +432,7 @@ def download_waifu2x():
         zip_path.unlink()
     
     try:
-        urllib.request.urlretrieve(url, zip_path, DownloadProgressBar())
+        download_file(url, zip_path)
         print(f"   Download complete!\n")
     except Exception as e:
         if zip_path.exists():
@@ -307,106 +440,154 @@ def download_waifu2x():
         raise ModelError(f"Download failed: {e}")
     
     print("Extracting archive...")
-    temp_dir = BIN_DIR / "temp_extract"
-    
+
     try:
-        if temp_dir.exists():
-            shutil.rmtree(temp_dir, ignore_errors=True)
-            time.sleep(0.3)
-        
-        temp_dir.mkdir(exist_ok=True)
-        
+        exe_installed = False
+        models_installed = set()
+
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-        
-        time.sleep(0.5)
-        
-        exe_found = None
-        for item in temp_dir.rglob("*"):
-            if item.is_file() and item.name in [exe_name, "waifu2x-ncnn-vulkan", "waifu2x-ncnn-vulkan.exe"]:
-                exe_found = item
-                break
-        
-        if not exe_found:
+            for member in zip_ref.infolist():
+                if member.is_dir():
+                    continue
+
+                parts = Path(member.filename).parts
+
+                if parts[-1] in ("waifu2x-ncnn-vulkan", "waifu2x-ncnn-vulkan.exe"):
+                    final_exe = BIN_DIR / exe_name
+                    _extract_member(zip_ref, member, final_exe)
+
+                    if system != "Windows":
+                        os.chmod(final_exe, 0o755)
+
+                    exe_installed = True
+                    continue
+
+                model_dir = next((p for p in parts if p.startswith("models-")), None)
+                if model_dir:
+                    rel_parts = parts[parts.index(model_dir):]
+                    target = MODELS_DIR / "waifu2x" / Path(*rel_parts)
+                    _extract_member(zip_ref, member, target)
+                    models_installed.add(model_dir)
+
+        if not exe_installed:
             raise ModelError("Could not find executable in archive")
-        
-        final_exe = BIN_DIR / exe_name
-        if final_exe.exists():
-            final_exe.unlink()
-            time.sleep(0.2)
-        
-        shutil.copy2(exe_found, final_exe)
+
         print(f"   Installed: {exe_name}")
-        
-        if system != "Windows":
-            os.chmod(final_exe, 0o755)
-        
-        models_copied = []
-        for item in temp_dir.rglob("*"):
-            if item.is_dir() and item.name.startswith("models-"):
-                model_name = item.name
-                final_model_dir = MODELS_DIR / "waifu2x" / model_name
-                
-                if final_model_dir.exists():
-                    shutil.rmtree(final_model_dir, ignore_errors=True)
-                    time.sleep(0.2)
-                
-                final_model_dir.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copytree(item, final_model_dir)
-                models_copied.append(model_name)
-        
-        if models_copied:
-            print(f"   Installed models: {', '.join(models_copied)}")
+
+        if models_installed:
+            print(f"   Installed models: {', '.join(sorted(models_installed))}")
         else:
             raise ModelError("No model directories found in archive")
-        
-        time.sleep(0.5)
-        shutil.rmtree(temp_dir, ignore_errors=True)
+
         if zip_path.exists():
             zip_path.unlink()
-        
+
+        check_waifu2x_installed.cache_clear()
+
         print(f"\n" + "="*67)
         print(f"WAIFU2X INSTALLED SUCCESSFULLY")
         print("="*67 + "\n")
-            
+
+    except ModelError:
+        if zip_path.exists():
+            zip_path.unlink()
+        raise
     except Exception as e:
-        shutil.rmtree(temp_dir, ignore_errors=True)
         if zip_path.exists():
             zip_path.unlink()
         raise ModelError(f"Extraction failed: {e}")
 
-def zip_directory(dir_path, zip_path, description="", cleanup=False):
-    import time
-    
+ZIP_CHUNK = 1024 * 1024
+
+def zip_directory(dir_path, zip_path, description="", cleanup=False, quiet=False):
+    import shutil
+    import zipfile
+
     try:
-        all_files = list(dir_path.rglob("*"))
-        files_to_zip = [f for f in all_files if f.is_file()]
-        
-        if not files_to_zip:
+        files = [p for p in dir_path.rglob("*") if p.is_file()]
+        total_files = len(files)
+
+        if not total_files:
             print(f"   No files to zip in {dir_path.name}")
             return False
-        
-        print(f"   Zipping: {dir_path.name} ({len(files_to_zip)} files)")
-        progress = ProgressTracker(len(files_to_zip), "Zipping")
-        
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as zipf:
-            for file_path in files_to_zip:
-                arcname = file_path.relative_to(dir_path.parent)
-                zipf.write(file_path, arcname)
-                progress.update(file_path.name)
-        
-        progress.finish()
-        
+
+        # quiet runs under the chapter zip pool, where several workers
+        # share one terminal: \r bars from concurrent processes shred
+        # each other, so only the one-line summaries are printed.
+        progress = None
+        if not quiet:
+            print(f"   Zipping: {dir_path.name} ({total_files} files)")
+            progress = ProgressTracker(total_files, "Zipping")
+
+        # Bound the preloaded-but-unwritten data by bytes, not file
+        # count: sixteen upscaled pages can be half a gigabyte. The
+        # bound is a submission window, not a semaphore held inside the
+        # workers: a permit stranded by a failed preload would deadlock
+        # the pool shutdown before the error ever surfaced.
+        max_preload_bytes = 64 * ZIP_CHUNK
+
+        def preload(file_path):
+            arcname = str(file_path.relative_to(dir_path.parent))
+            with open(file_path, "rb", buffering=ZIP_CHUNK) as src:
+                return file_path, arcname, src.read()
+
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 4)) as pool, \
+             zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as zipf:
+            window = []
+            window_bytes = 0
+            next_idx = 0
+            count = 0
+
+            while window or next_idx < total_files:
+                # Always keep at least one preload in flight so a single
+                # file larger than the budget still makes progress.
+                while next_idx < total_files and \
+                        (not window or window_bytes < max_preload_bytes):
+                    size = files[next_idx].stat().st_size
+                    window.append((pool.submit(preload, files[next_idx]), size))
+                    window_bytes += size
+                    next_idx += 1
+
+                future, size = window.pop(0)
+                window_bytes -= size
+                file_path, arcname, data = future.result()
+                name = file_path.name
+
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                zinfo.compress_type = zipfile.ZIP_STORED
+
+                # Feed the entry in 1 MB slices so zipfile's incremental
+                # zlib.crc32 runs over large buffers, not 8 KB pieces.
+                with zipf.open(zinfo, "w", force_zip64=True) as entry:
+                    for offset in range(0, len(data), ZIP_CHUNK):
+                        entry.write(data[offset:offset + ZIP_CHUNK])
+
+                count += 1
+                if progress and (count % 16 == 0 or count == total_files):
+                    progress.current_item = count
+                    progress._display(name)
+
+        if progress:
+            progress.finish()
+
         zip_size_mb = zip_path.stat().st_size / (1024 * 1024)
         print(f"   Created: {zip_path.name} ({zip_size_mb:.1f} MB)")
         
         if cleanup:
             try:
-                time.sleep(0.2)
-                shutil.rmtree(dir_path)
+                # O(1) rename out of the way, then delete in the background
+                # (non-daemon so the interpreter finishes it before exit).
+                pending = dir_path.with_name(dir_path.name + ".pending_delete")
+                os.rename(dir_path, pending)
+                threading.Thread(target=shutil.rmtree, args=(pending,),
+                                 kwargs={"ignore_errors": True}).start()
                 print(f"   Removed: {dir_path.name}")
-            except Exception as e:
-                print(f"   Warning: Could not remove {dir_path.name}: {e}")
+            except OSError:
+                try:
+                    shutil.rmtree(dir_path)
+                    print(f"   Removed: {dir_path.name}")
+                except Exception as e:
+                    print(f"   Warning: Could not remove {dir_path.name}: {e}")
         
         print()
         return True
@@ -415,74 +596,218 @@ def zip_directory(dir_path, zip_path, description="", cleanup=False):
         print(f"   Failed to zip {dir_path.name}: {e}\n")
         return False
 
-def run_waifu2x(input_path, output_path, quality_settings=None, progress_tracker=None):
+def _pending_images(images, output_path, out_format=None):
+    try:
+        with os.scandir(output_path) as it:
+            existing = {e.name: e.stat() for e in it if e.is_file()}
+    except FileNotFoundError:
+        existing = {}
+
+    def done(p):
+        # An output counts only if it is non-empty (a kill mid-write can
+        # leave a truncated file) and at least as new as its input. The
+        # lookup keys on the name the invocation actually produces, so
+        # e.g. a.jpeg is matched against a.jpg.
+        st = existing.get(_output_name(p, out_format))
+        return st is not None and st.st_size > 0 and st.st_mtime >= p.stat().st_mtime
+
+    return [p for p in images if not done(p)]
+
+# Formats the binary's -f flag understands, keyed by input extension;
+# .jpeg has no -f name of its own, so those pages come back as .jpg.
+_EXT_FORMAT = {".png": "png", ".jpg": "jpg", ".jpeg": "jpg", ".webp": "webp"}
+
+def _output_name(img_path, out_format=None):
+    fmt = out_format or _EXT_FORMAT.get(img_path.suffix.lower(), "png")
+    return f"{img_path.stem}.{fmt}"
+
+def _format_groups(images, out_format=None):
+    # Directory mode names every output <stem>.<format> with one format
+    # per invocation, so a mixed folder is batched per output format to
+    # keep jpg/webp pages from being silently re-encoded to png.
+    groups = {}
+    for p in images:
+        fmt = out_format or _EXT_FORMAT.get(p.suffix.lower(), "png")
+        groups.setdefault(fmt, []).append(p)
+    return sorted(groups.items())
+
+def _waifu2x_flags(quality_settings, models_dir):
+    flags = ["-s", "2", "-m", str(models_dir)]
+
+    if quality_settings:
+        flags += ["-n", str(quality_settings.get("denoise_level", 0))]
+
+        if quality_settings.get("tile_size", 0) > 0:
+            flags += ["-t", str(quality_settings["tile_size"])]
+
+        if "gpu_id" in quality_settings:
+            flags += ["-g", str(quality_settings["gpu_id"])]
+    else:
+        flags += ["-n", "0"]
+
+    # Overlap PNG decode/encode with GPU inference; the binary's default
+    # thread split leaves the GPU idle between small images.
+    if quality_settings and quality_settings.get("jobs"):
+        flags += ["-j", quality_settings["jobs"]]
+    else:
+        ncpu = os.cpu_count() or 4
+        load = min(4, max(1, ncpu // 2))
+        save = min(4, max(1, ncpu // 2))
+        flags += ["-j", f"{load}:2:{save}"]
+
+    return flags
+
+def _stage_inputs(images):
+    import shutil
+    import tempfile
+
+    # Hardlink (or copy, cross-device) inputs into a tmpfs-backed staging
+    # dir so the binary reads local memory instead of a slow filesystem.
+    stage_root = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    stage = tempfile.TemporaryDirectory(prefix="manga-upscaler-", dir=stage_root)
+    stage_path = Path(stage.name)
+
+    for img_path in images:
+        target = stage_path / img_path.name
+        try:
+            os.link(img_path, target)
+        except OSError:
+            shutil.copy2(img_path, target)
+
+    return stage, stage_path
+
+def run_waifu2x(input_path, output_path, quality_settings=None, progress_tracker=None,
+                images=None, force=False, stage=False):
     system = platform.system()
     exe_name = "waifu2x-ncnn-vulkan.exe" if system == "Windows" else "waifu2x-ncnn-vulkan"
     waifu_bin = BIN_DIR / exe_name
     models_dir = MODELS_DIR / "waifu2x" / "models-cunet"
 
     output_path.mkdir(parents=True, exist_ok=True)
-    
-    if input_path.is_file():
-        images = [input_path]
-    else:
-        images = list(input_path.glob("*.png")) + list(input_path.glob("*.jpg")) + \
-                 list(input_path.glob("*.jpeg")) + list(input_path.glob("*.webp"))
-        images = sorted(images)
-    
+
+    if images is None:
+        if input_path.is_file():
+            images = [input_path]
+        else:
+            images = _list_images(input_path)
+
     if not images:
         print("   No images found")
         return
-    
-    for idx, img_path in enumerate(images, 1):
-        out_file = output_path / img_path.name
-        
-        cmd = [
-            str(waifu_bin),
-            "-i", str(img_path),
-            "-o", str(out_file),
-            "-s", "2",
-            "-m", str(models_dir)
-        ]
-        
-        if quality_settings:
-            if "denoise_level" in quality_settings:
-                cmd.extend(["-n", str(quality_settings["denoise_level"])])
-            else:
-                cmd.extend(["-n", "0"])
-                
-            if "tile_size" in quality_settings and quality_settings["tile_size"] > 0:
-                cmd.extend(["-t", str(quality_settings["tile_size"])])
-                
-            if "gpu_id" in quality_settings:
-                cmd.extend(["-g", str(quality_settings["gpu_id"])])
+
+    out_format = quality_settings.get("format") if quality_settings else None
+    pending = images if force else _pending_images(images, output_path, out_format)
+
+    if not pending:
+        print("   All outputs up to date, skipping")
+        return
+
+    flags = _waifu2x_flags(quality_settings, models_dir)
+    waifu_bin_s = str(waifu_bin)
+
+    debug = bool(os.environ.get("MANGA_UPSCALER_DEBUG"))
+
+    def read_progress(pipe, tail):
+        for line in pipe:
+            line = line.strip()
+            if debug:
+                print(f"   waifu2x: {line}")
+            if line.endswith("done"):
+                if progress_tracker:
+                    name = Path(line.split(" -> ")[0]).name
+                    progress_tracker.update(name)
+            elif line:
+                # Keep the last few non-progress lines: that is where the
+                # binary reports a bad -g id or a decode failure.
+                tail.append(line)
+                del tail[:-5]
+
+    def invoke(src, dst, count, fmt=None):
+        cmd = [waifu_bin_s, "-i", str(src), "-o", str(dst), *flags]
+        if fmt:
+            cmd += ["-f", fmt]
+
+        tail = []
+
+        if progress_tracker or debug:
+            # The binary is silent on success unless -v is passed; the
+            # "<in> -> <out> done" lines are what feed the progress bar.
+            cmd.append("-v")
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, text=True)
+            reader = threading.Thread(target=read_progress, args=(proc.stdout, tail),
+                                      daemon=True)
+            reader.start()
         else:
-            cmd.extend(["-n", "0"])
-        
+            # Nothing consumes the output: skip pipe buffering and decoding.
+            proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL)
+            reader = None
+
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-            
-            if result.returncode == 0:
-                if progress_tracker:
-                    progress_tracker.update(img_path.name)
-            else:
-                if progress_tracker:
-                    progress_tracker.update(f"{img_path.name} (failed)")
-                    
+            returncode = proc.wait(timeout=300 * count)
         except subprocess.TimeoutExpired:
-            if progress_tracker:
-                progress_tracker.update(f"{img_path.name} (timeout)")
-        except Exception as e:
-            if progress_tracker:
-                progress_tracker.update(f"{img_path.name} (error)")
+            proc.kill()
+            proc.wait()
+            raise
+
+        if reader:
+            reader.join(timeout=5)
+
+        if returncode != 0:
+            if not debug:
+                for line in tail:
+                    print(f"   waifu2x: {line}")
+            raise subprocess.CalledProcessError(returncode, cmd)
+
+    if input_path.is_file():
+        invoke(input_path, output_path / _output_name(input_path, out_format), 1,
+               out_format)
+        return
+
+    if len(pending) < len(images):
+        print(f"   Resuming: {len(images) - len(pending)} of {len(images)} already done")
+
+    for fmt, group in _format_groups(pending, out_format):
+        if len(group) == len(images) and not stage:
+            # Whole folder, one output format: one batched invocation.
+            invoke(input_path, output_path, len(group), fmt)
+            continue
+
+        # Stage the subset into one directory so a single invocation still
+        # amortizes driver init and model load over the whole group.
+        try:
+            staged, staged_path = _stage_inputs(group)
+        except OSError:
+            staged = None
+
+        if staged:
+            try:
+                invoke(staged_path, output_path, len(group), fmt)
+            finally:
+                staged.cleanup()
+        else:
+            for img_path in group:
+                invoke(img_path, output_path / _output_name(img_path, fmt), 1, fmt)
+
+def _print_stage_timings(timings):
+    if not timings:
+        return
 
-def process_images(input_dir, output_dir, model_name, nested=False, quality_settings=None, zip_output=False, zip_nested=False):
+    print("\nStage timings:")
+    for stage_name, seconds in timings.items():
+        print(f"   {stage_name:<10}{seconds:7.1f}s")
+    print(f"   {'total':<10}{sum(timings.values()):7.1f}s")
+
+def process_images(input_dir, output_dir, model_name, nested=False, quality_settings=None, zip_output=False, zip_nested=False, force=False, stage=False, workers=None):
     input_path = Path(input_dir)
     output_path = Path(output_dir)
 
     if not input_path.exists():
         raise FileNotFoundError(f"Input directory not found: {input_path}")
 
+    out_format = quality_settings.get("format") if quality_settings else None
+
     print("Checking model requirements...\n")
     verify_model_requirements(model_name)
     print("All requirements met!\n")
@@ -507,74 +832,152 @@ def process_images(input_dir, output_dir, model_name, nested=False, quality_sett
 
     if model_name == "waifu2x":
         print("Using waifu2x x2 (fast manga mode)\n")
+
+        # Wall-clock per stage, so users can see whether a run was bound
+        # by scanning, upscaling, or zipping before they start tuning.
+        timings = {}
+        stage_start = time.perf_counter()
+        failed = []
         
         if nested:
             print(f"Scanning nested structure in: {input_path}\n")
-            subdirs = [d for d in input_path.iterdir() if d.is_dir()]
-            
+            loose_images, chapter_images = _scan_chapters(input_path)
+            subdirs = list(chapter_images)
+            timings["scan"] = time.perf_counter() - stage_start
+            stage_start = time.perf_counter()
+
             if not subdirs:
                 print("No subdirectories found. Processing as flat directory...\n")
-                images = list(input_path.glob("*.png")) + list(input_path.glob("*.jpg")) + \
-                         list(input_path.glob("*.jpeg")) + list(input_path.glob("*.webp"))
-                progress = ProgressTracker(len(images), "Upscaling")
-                run_waifu2x(input_path, output_path, quality_settings, progress)
+                images = loose_images
+                pending = images if force else _pending_images(images, output_path, out_format)
+                progress = ProgressTracker(len(pending), "Upscaling")
+                run_waifu2x(input_path, output_path, quality_settings, progress,
+                            images=images, force=force, stage=stage)
                 progress.finish()
+                timings["upscale"] = time.perf_counter() - stage_start
             else:
                 print(f"Found {len(subdirs)} subdirectories (chapters)\n")
                 print("=" * 70)
-                
-                total_images = 0
-                for subdir in subdirs:
-                    images = list(subdir.glob("*.png")) + list(subdir.glob("*.jpg")) + \
-                             list(subdir.glob("*.jpeg")) + list(subdir.glob("*.webp"))
-                    total_images += len(images)
-                
-                print(f"Total: {len(subdirs)} chapters, {total_images} images\n")
-                progress = ProgressTracker(total_images, "Overall Progress")
-                
-                for idx, subdir in enumerate(sorted(subdirs), 1):
-                    print(f"\nChapter [{idx}/{len(subdirs)}]: {subdir.name}")
-                    print("-" * 70)
-                    
-                    sub_output = output_path / subdir.name
-                    
-                    try:
-                        run_waifu2x(subdir, sub_output, quality_settings, progress)
-                        print(f"   Completed: {subdir.name}\n")
-                    except subprocess.CalledProcessError as e:
-                        print(f"   Failed to process {subdir.name}: {e}\n")
-                
+
+                total_images = sum(len(imgs) for imgs in chapter_images.values())
+
+                if force:
+                    total_pending = total_images
+                else:
+                    total_pending = sum(
+                        len(_pending_images(imgs, output_path / subdir.name, out_format))
+                        for subdir, imgs in chapter_images.items())
+
+                print(f"Total: {len(subdirs)} chapters, {total_images} images"
+                      f" ({total_pending} to process)\n")
+                progress = ProgressTracker(total_pending, "Overall Progress")
+
+                # Chapters are independent: with several GPUs and no --gpu
+                # pin, shard them round-robin across the devices. --workers
+                # can force chapter concurrency even on a single GPU, where
+                # one chapter's decode/save threads overlap another's compute.
+                gpus = detect_vulkan_gpus()
+                gpu_pinned = bool(quality_settings and "gpu_id" in quality_settings)
+                multi_gpu = len(gpus) > 1 and not gpu_pinned
+
+                if workers is None:
+                    workers = len(gpus) if multi_gpu else 1
+                workers = max(1, min(workers, len(subdirs)))
+
+                if workers > 1:
+                    if multi_gpu:
+                        print(f"Distributing chapters across {len(gpus)} GPUs\n")
+                    else:
+                        print(f"Processing {workers} chapters concurrently\n")
+
+                    def upscale_chapter(subdir, gpu_id):
+                        settings = dict(quality_settings or {})
+                        if gpu_id is not None:
+                            settings["gpu_id"] = gpu_id
+                        run_waifu2x(subdir, output_path / subdir.name, settings,
+                                    progress, images=chapter_images[subdir],
+                                    force=force, stage=stage)
+
+                    with ThreadPoolExecutor(max_workers=workers) as pool:
+                        futures = [(subdir,
+                                    pool.submit(upscale_chapter, subdir,
+                                                gpus[idx % len(gpus)]['id'] if multi_gpu else None))
+                                   for idx, subdir in enumerate(subdirs)]
+                        for subdir, future in futures:
+                            try:
+                                future.result()
+                            except (subprocess.CalledProcessError,
+                                    subprocess.TimeoutExpired) as e:
+                                print(f"   Failed to process {subdir.name}: {e}\n")
+                                failed.append(subdir.name)
+                else:
+                    for idx, subdir in enumerate(subdirs, 1):
+                        print(f"\nChapter [{idx}/{len(subdirs)}]: {subdir.name}")
+                        print("-" * 70)
+
+                        sub_output = output_path / subdir.name
+
+                        try:
+                            run_waifu2x(subdir, sub_output, quality_settings, progress,
+                                        images=chapter_images[subdir],
+                                        force=force, stage=stage)
+                            print(f"   Completed: {subdir.name}\n")
+                        except (subprocess.CalledProcessError,
+                                subprocess.TimeoutExpired) as e:
+                            print(f"   Failed to process {subdir.name}: {e}\n")
+                            failed.append(subdir.name)
+
                 progress.finish()
+                timings["upscale"] = time.perf_counter() - stage_start
                 print("\n" + "=" * 70)
-                print("All chapters processed successfully")
+                if failed:
+                    print(f"{len(subdirs) - len(failed)} of {len(subdirs)} chapters processed,"
+                          f" {len(failed)} failed: {', '.join(failed)}")
+                else:
+                    print("All chapters processed successfully")
                 print("=" * 70)
-                
+
                 if zip_nested:
+                    stage_start = time.perf_counter()
                     print("\n" + "="*67)
                     print("ZIPPING CHAPTERS")
                     print("="*67 + "\n")
                     
+                    with os.scandir(output_path) as it:
+                        chapter_dirs = sorted(Path(e.path) for e in it
+                                              if e.is_dir(follow_symlinks=False))
+
                     zipped_count = 0
-                    for subdir in sorted(output_path.iterdir()):
-                        if subdir.is_dir():
-                            zip_path = output_path / f"{subdir.name}.zip"
-                            if zip_directory(subdir, zip_path, cleanup=True):
-                                zipped_count += 1
-                    
+                    if chapter_dirs:
+                        workers = min(len(chapter_dirs), os.cpu_count() or 1)
+                        with ProcessPoolExecutor(max_workers=workers) as pool:
+                            futures = [pool.submit(zip_directory, d,
+                                                   output_path / f"{d.name}.zip",
+                                                   cleanup=True, quiet=True)
+                                       for d in chapter_dirs]
+                            zipped_count = sum(1 for f in futures if f.result())
+
+                    timings["zip"] = time.perf_counter() - stage_start
+
                     if zipped_count > 0:
                         print("=" * 70)
                         print(f"Successfully zipped {zipped_count} chapter(s)")
                         print(f"Removed {zipped_count} original folder(s) to save space")
                         print("=" * 70)
         else:
-            images = list(input_path.glob("*.png")) + list(input_path.glob("*.jpg")) + \
-                     list(input_path.glob("*.jpeg")) + list(input_path.glob("*.webp"))
-            print(f"Found {len(images)} images to process\n")
-            progress = ProgressTracker(len(images), "Upscaling")
-            run_waifu2x(input_path, output_path, quality_settings, progress)
+            images = _list_images(input_path)
+            pending = images if force else _pending_images(images, output_path, out_format)
+            timings["scan"] = time.perf_counter() - stage_start
+            stage_start = time.perf_counter()
+            print(f"Found {len(images)} images ({len(pending)} to process)\n")
+            progress = ProgressTracker(len(pending), "Upscaling")
+            run_waifu2x(input_path, output_path, quality_settings, progress,
+                        images=images, force=force, stage=stage)
             progress.finish()
+            timings["upscale"] = time.perf_counter() - stage_start
             
             if zip_output:
+                stage_start = time.perf_counter()
                 print("\n" + "="*67)
                 print("ZIPPING OUTPUT")
                 print("="*67 + "\n")
@@ -585,6 +988,14 @@ def process_images(input_dir, output_dir, model_name, nested=False, quality_sett
                     print(f"Output zipped successfully")
                     print(f"Removed original folder to save space")
                     print("=" * 70)
+                timings["zip"] = time.perf_counter() - stage_start
+
+        _print_stage_timings(timings)
+
+        # Chapter failures were reported per chapter and must not look
+        # like success to scripts; flat-mode failures raise instead.
+        if failed:
+            sys.exit(1)
         return
 
 def list_models():
@@ -651,7 +1062,9 @@ def show_usage():
     print("QUALITY SETTINGS (Manual Override):")
     print("  --denoise N     [waifu2x] Denoise level: -1=none, 0=low, 1-3=higher")
     print("  --tile-size N   Tile size: 0=auto, 32-2048 for manual control")
-    print("  --gpu N         GPU device ID to use (default: 0)\n")
+    print("  --gpu N         GPU device ID to use (default: auto)")
+    print("  --jobs L:P:S    waifu2x load/proc/save thread split (default: auto)")
+    print("  --format FMT    Output format: png, jpg, webp (default: same as input)\n")
     
     print("GPU MANAGEMENT:")
     print("  # List detected GPUs and their IDs")
@@ -671,7 +1084,10 @@ def show_usage():
     print("  --nested              Process nested folder structure (chapters)")
     print("  -m, --model NAME      Model to use (default: waifu2x)")
     print("  -q, --quality PRESET  Quality preset: fast, balanced, quality")
-    print("  --gpu N               GPU device ID to use (default: 0)")
+    print("  --gpu N               GPU device ID to use (default: auto)")
+    print("  --force               Re-process images even if up-to-date outputs exist")
+    print("  --stage               Stage inputs in tmpfs first (slow/network filesystems)")
+    print("  --workers N           Concurrent chapter workers with --nested (default: one per GPU)")
     print("  --zip                 Zip output directory after processing and remove original folder")
     print("  --zip-chapters        Zip each chapter separately (with --nested) and remove original folders")
     print("  --list-gpus           List all detected Vulkan GPUs")
@@ -692,6 +1108,21 @@ def show_usage():
     print("  - Overall progress for nested folder structures\n")
 
 def main():
+    # Fast paths for trivial commands: no parser construction needed.
+    if len(sys.argv) == 1 or (len(sys.argv) == 2 and sys.argv[1] in ("-h", "--help")):
+        show_usage()
+        sys.exit(0)
+
+    if "--list-gpus" in sys.argv:
+        list_gpus()
+        sys.exit(0)
+
+    if "--list-models" in sys.argv:
+        list_models()
+        sys.exit(0)
+
+    import argparse
+
     parser = argparse.ArgumentParser(add_help=False)
     
     parser.add_argument("-i", "--input", type=str, help="Input directory path")
@@ -711,9 +1142,20 @@ def main():
                        help="[waifu2x] Denoise level (-1=none, 0=low, 1-3=higher)")
     parser.add_argument("--tile-size", type=int,
                        help="Tile size for processing (0=auto, 32-2048 manual)")
-    parser.add_argument("--gpu", type=int, default=0,
-                       help="GPU device ID to use (default: 0)")
-    
+    parser.add_argument("--gpu", type=int, default=None,
+                       help="GPU device ID to use (default: auto)")
+    parser.add_argument("--jobs", type=str,
+                       help="waifu2x thread split as LOAD:PROC:SAVE (default: auto)")
+    parser.add_argument("--format", type=str, choices=["png", "jpg", "webp"],
+                       help="Output image format (default: same as input)")
+    
+    parser.add_argument("--force", action="store_true",
+                       help="Re-process images even if up-to-date outputs exist")
+    parser.add_argument("--stage", action="store_true",
+                       help="Stage inputs in a tmpfs directory first (for slow/network filesystems)")
+    parser.add_argument("--workers", type=int, default=None,
+                       help="Concurrent chapter workers with --nested (default: one per GPU)")
+
     parser.add_argument("--zip", action="store_true",
                        help="Zip output directory after processing and remove original folder")
     parser.add_argument("--zip-chapters", action="store_true",
@@ -730,24 +1172,12 @@ def main():
     parser.add_argument("-h", "--help", action="store_true",
                        help="Show help message")
     
-    if len(sys.argv) == 1:
-        show_usage()
-        sys.exit(0)
-    
     args = parser.parse_args()
-    
+
     if args.help:
         show_usage()
         sys.exit(0)
-    
-    if args.list_gpus:
-        list_gpus()
-        sys.exit(0)
-    
-    if args.list_models:
-        list_models()
-        sys.exit(0)
-    
+
     if args.download:
         try:
             if args.download == "waifu2x":
@@ -788,9 +1218,20 @@ def main():
     if args.denoise is not None:
         quality_settings["denoise_level"] = args.denoise
     if args.tile_size is not None:
+        tile_max = AVAILABLE_MODELS[args.model]["quality_settings"]["tile_size"]["max"]
+        if args.tile_size != 0 and not 32 <= args.tile_size <= tile_max:
+            print(f"Error: --tile-size must be 0 (auto) or 32-{tile_max}")
+            sys.exit(1)
         quality_settings["tile_size"] = args.tile_size
     if args.gpu is not None:
         quality_settings["gpu_id"] = args.gpu
+    if args.jobs:
+        if not re.fullmatch(r"\d+:\d+:\d+", args.jobs):
+            print("Error: --jobs must be LOAD:PROC:SAVE, e.g. 2:2:2")
+            sys.exit(1)
+        quality_settings["jobs"] = args.jobs
+    if args.format:
+        quality_settings["format"] = args.format
     
     print("\n" + "="*67)
     print("MANGA AI UPSCALER - Configuration")
@@ -816,7 +1257,10 @@ def main():
             nested=args.nested,
             quality_settings=quality_settings if quality_settings else None,
             zip_output=args.zip,
-            zip_nested=args.zip_chapters
+            zip_nested=args.zip_chapters,
+            force=args.force,
+            stage=args.stage,
+            workers=args.workers
         )
     except ModelError as e:
         print(f"\n{e}")
@@ -824,6 +1268,9 @@ def main():
     except FileNotFoundError as e:
         print(f"\nError: {e}\n")
         sys.exit(1)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        print(f"\nUpscaling failed: {e}\n")
+        sys.exit(1)
     except Exception as e:
         print(f"\nUnexpected error: {e}\n")
         import traceback